@@ -1,36 +1,81 @@
 # Import delle librerie principali di FastAPI
-from fastapi import FastAPI, Body, HTTPException  # FastAPI per creare l'app, Body per leggere i dati del corpo delle richieste, HTTPException per gestire errori API
+from fastapi import FastAPI, HTTPException, Request  # FastAPI per creare l'app, HTTPException per gestire errori API, Request per leggere il corpo grezzo delle richieste
+# ORJSONResponse serializza le risposte in JSON con orjson (implementazione in C),
+# Response permette di restituire byte JSON già serializzati
+from fastapi.responses import ORJSONResponse, Response
 # Middleware CORS per permettere richieste da origini diverse (es. frontend su localhost)
 from fastapi.middleware.cors import CORSMiddleware
 # StaticFiles serve per servire file statici (HTML, CSS, JS) del frontend
 from fastapi.staticfiles import StaticFiles
 # Tipi Python per annotare i parametri e migliorare la leggibilità
 from typing import Dict, Any
+# Per definire il ciclo di vita (avvio/spegnimento) dell'app
+from contextlib import asynccontextmanager
 # Modulo standard per gestire i percorsi dei file
 import os
+# Logging standard (sotto uvicorn i messaggi finiscono nella console del server)
+import logging
 # Import della classe che gestisce il modello di Machine Learning
 from .model_service import ModelService
-# Import di NumPy per gestire tipi numerici e conversioni
-import numpy as np
+# Batcher che raggruppa le richieste di predizione concorrenti in un'unica chiamata al modello
+from .batcher import DynamicBatcher
 import re
-
-app = FastAPI(title="PE Performance Predictor", version="2.0")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], allow_credentials=True,
-    allow_methods=["*"], allow_headers=["*"],
+# Parser JSON veloce usato dagli endpoint POST per leggere il body
+import orjson
+# msgspec decodifica/serializza direttamente le Struct di richiesta e risposta di /api/predict
+import msgspec
+from .schemas import PredictRequest, PredictResponse
+
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------- REGEX PRECOMPILATE -------------------
+
+# Unico pattern usato da /api/parse_text, compilato una sola volta all'import del modulo.
+# Ogni alternativa ha un gruppo con nome (l'"ID" della corrispondenza): il testo viene
+# scansionato una sola volta con finditer e ogni match viene smistato tramite m.lastgroup.
+_PARSE_TEXT_RE = re.compile(
+    r"(?P<age>(?P<age_n>\d{1,2})\s*anni)"
+    r"|(?P<hours>(?P<hours_n>\d{1,2})\s*(?:ore|volte))"
+    r"|(?P<male>maschio|uomo)"
+    r"|(?P<female>femmina|donna)"
+    r"|(?P<motivation_high>motivat[ao]|alta motivazione)"
+    r"|(?P<motivation_low>poca motivazione|bassa motivazione)"
+    r"|(?P<participation_high>partecipa sempre|molto attiva)"
+    r"|(?P<participation_low>poco partecipe)"
 )
 
-model_service = ModelService()
-
-
+# Default numerici usati da /api/parse_text per i campi non citati nel testo (costante, mai modificata)
+_PARSE_DEFAULTS = {
+    "Strength_Score": 75,
+    "Endurance_Score": 70,
+    "Flexibility_Score": 60,
+    "Speed_Agility_Score": 65,
+    "BMI": 22.5,
+    "Health_Fitness_Knowledge_Score": 70,
+    "Skills_Score": 75,
+    "Attendance_Rate": 95,
+    "Overall_PE_Performance_Score": 80,
+    "Improvement_Rate": 10,
+    "Final_Grade": "B",
+    "Previous_Semester_PE_Grade": "B",
+    "Grade_Level": "11th",
+}
 
 
 # ------------------- CREAZIONE DELL'APPLICAZIONE FASTAPI -------------------
 
-# Inizializza l'app FastAPI e imposta alcune info di descrizione
-app = FastAPI(title="PE Performance Predictor", version="1.0")
+# All'avvio fa partire il batcher delle predizioni, allo spegnimento lo ferma
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    batcher.start()
+    yield
+    await batcher.stop()
+
+# Inizializza l'app FastAPI e imposta alcune info di descrizione.
+# Tutte le risposte vengono serializzate con orjson (ORJSONResponse) invece del modulo json standard.
+app = FastAPI(title="PE Performance Predictor", version="2.0", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 
 # ------------------- CONFIGURAZIONE DEL MIDDLEWARE CORS -------------------
@@ -52,124 +97,160 @@ app.add_middleware(
 # gli encoder e lo scaler dai file .pkl presenti nella cartella "data/"
 model_service = ModelService()
 
+# Le richieste che arrivano entro 5 ms l'una dall'altra (fino a 32) vengono predette insieme
+batcher = DynamicBatcher(model_service, max_batch_size=32, max_delay=0.005)
+
+# Lo schema dipende solo dagli artefatti caricati: lo serializziamo una sola volta
+_SCHEMA_BODY = orjson.dumps(model_service.schema_for_frontend())
+
 
 # ------------------- ENDPOINT /api/schema -------------------
 
 # Endpoint GET per ottenere lo "schema" dei campi richiesti dal modello
 # (cioè: nomi delle colonne, tipo di campo e possibili valori per i campi categorici)
 @app.get("/api/schema")
-def get_schema():
-    # Ritorna al frontend lo schema dei dati attesi per la predizione
-    return model_service.schema_for_frontend()
+async def get_schema():
+    # Ritorna al frontend lo schema dei dati attesi per la predizione (byte già pronti)
+    return Response(content=_SCHEMA_BODY, media_type="application/json")
 
 
-# ------------------- ENDPOINT /api/predict -------------------
+# ------------------- LETTURA DEL BODY JSON -------------------
 
-# Endpoint POST per ricevere i dati dallo user (frontend) e restituire una predizione
-@app.post("/api/predict")
-def predict(payload: Dict[str, Any] = Body(...)):
+async def _read_json_body(request: Request) -> Dict[str, Any]:
+    """
+    Legge il corpo della richiesta e lo decodifica con orjson,
+    senza passare dalla dependency injection / validazione di FastAPI.
+    """
+    body = await request.body()
     try:
-        # 1️⃣ Recupera il dizionario di feature dal body della richiesta
-        # Il frontend può inviare {"features": {...}} oppure direttamente {...}
-        features = payload.get("features", payload)
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Il body della richiesta non è un JSON valido.")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Il body della richiesta deve essere un oggetto JSON.")
+    return payload
+
 
-        # 2️⃣ Esegue la predizione usando il servizio del modello ML
-        pred, proba, used = model_service.predict_one(features)
+# Decoder/encoder creati una volta sola e riusati a ogni richiesta
+# (ModelService restituisce già tipi Python puri, non servono conversioni per numpy)
+_PREDICT_DECODER = msgspec.json.Decoder(PredictRequest)
+_PREDICT_ENCODER = msgspec.json.Encoder()
 
-        # 3️⃣ Converte la predizione in tipo Python puro (es. int invece di numpy.int64)
-        if isinstance(pred, np.generic):
-            pred = pred.item()
 
-        model_name = getattr(getattr(model_service.model, "__class__", None), "__name__", "UnknownModel")
+async def _read_predict_features(request: Request) -> Dict[str, Any]:
+    """
+    Decodifica il body di /api/predict direttamente in una PredictRequest.
+    Il frontend può inviare {"features": {...}} oppure direttamente {...}.
+    """
+    body = await request.body()
+    try:
+        return _PREDICT_DECODER.decode(body).features
+    except msgspec.ValidationError:
+        # JSON valido ma non conforme a PredictRequest: si gestisce sotto
+        pass
+    except msgspec.DecodeError:
+        raise HTTPException(status_code=400, detail="Il body della richiesta non è un JSON valido.")
+
+    payload = msgspec.json.decode(body)
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Il body della richiesta deve essere un oggetto JSON.")
+    # "features" presente ma non valido (es. lista o null): errore, non si predice sui default
+    if "features" in payload:
+        raise HTTPException(status_code=400, detail='Il campo "features" deve essere un oggetto JSON.')
+    # Senza "features": le feature sono direttamente nell'oggetto
+    return payload
+
 
-        # 4️⃣ Ritorna il risultato al frontend in formato JSON
-        return {
-            "prediction": pred,       # valore predetto (es. "High" o 2)
-            "proba": proba,           # dizionario di probabilità per ogni classe
-            "used_features": used,    # elenco delle feature usate dal modello
-            "model_name": model_name,     # 👈 Aggiunto
-            "message": "OK"           # messaggio di conferma
+# ------------------- ENDPOINT /api/predict -------------------
 
-        }
+# Endpoint POST per ricevere i dati dallo user (frontend) e restituire una predizione.
+# È registrato come route Starlette "pura" (vedi app.add_route sotto): legge il body
+# direttamente, senza Body(...) e senza la risoluzione delle dipendenze di FastAPI.
+async def predict(request: Request):
+    # 1️⃣ Recupera il dizionario di feature dal body della richiesta
+    features = await _read_predict_features(request)
+    try:
+        # 2️⃣ Esegue la predizione usando il servizio del modello ML (tramite il batcher)
+        pred, proba, used = await batcher.predict(features)
+
+        # 3️⃣ Ritorna il risultato al frontend in formato JSON (serializzato da msgspec)
+        resp = PredictResponse(
+            prediction=pred,          # valore predetto (es. "High" o 2)
+            proba=proba,              # dizionario di probabilità per ogni classe
+            used_features=used,       # elenco delle feature usate dal modello
+            model_name=model_service.model_name,  # 👈 Aggiunto
+            message="OK",             # messaggio di conferma
+        )
+        return Response(content=_PREDICT_ENCODER.encode(resp), media_type="application/json")
 
     # ------------------- GESTIONE ERRORI -------------------
     except Exception as e:
-        import traceback
-        # Stampa il traceback completo in console (utile per debug)
-        traceback.print_exc()
+        # Registra il traceback completo nei log (utile per debug)
+        logger.exception("predict failed")
 
         # Restituisce un errore HTTP 500 al frontend con il messaggio dell’eccezione
         raise HTTPException(status_code=500, detail=str(e))
 
 
+app.add_route("/api/predict", predict, methods=["POST"])
 
 
-@app.post("/api/parse_text")
-def parse_text(payload: Dict[str, str] = Body(...)):
+
+
+async def parse_text(request: Request):
     """
     Riceve una frase naturale e prova a generare un dizionario di feature.
     """
-    text = payload.get("text", "").lower()
+    payload = await _read_json_body(request)
+    text = str(payload.get("text", "")).lower()
 
     features = {}
 
     # Esempio di estrazioni semplici con regex o keyword matching
     # (puoi arricchirlo con spaCy o un modello LLM se vuoi più precisione)
-    age_match = re.search(r"(\d{1,2})\s*anni", text)
-    if age_match:
-        features["Age"] = int(age_match.group(1))
+    # Un solo passaggio sul testo: per ogni ID si tiene la prima corrispondenza trovata
+    found = {}
+    for m in _PARSE_TEXT_RE.finditer(text):
+        found.setdefault(m.lastgroup, m)
 
-    if "maschio" in text or "uomo" in text:
+    if "age" in found:
+        features["Age"] = int(found["age"].group("age_n"))
+
+    if "male" in found:
         features["Gender"] = "Male"
-    elif "femmina" in text or "donna" in text:
+    elif "female" in found:
         features["Gender"] = "Female"
     else:
         features["Gender"] = "Other"
 
-    if "motivata" in text or "motivato" in text or "alta motivazione" in text:
+    if "motivation_high" in found:
         features["Motivation_Level"] = "High"
-    elif "poca motivazione" in text or "bassa motivazione" in text:
+    elif "motivation_low" in found:
         features["Motivation_Level"] = "Low"
     else:
         features["Motivation_Level"] = "Medium"
 
     # Esempio per ore di attività
-    match_hours = re.search(r"(\d{1,2})\s*(ore|volte)", text)
-    if match_hours:
-        features["Hours_Physical_Activity_Per_Week"] = int(match_hours.group(1))
+    if "hours" in found:
+        features["Hours_Physical_Activity_Per_Week"] = int(found["hours"].group("hours_n"))
     else:
         features["Hours_Physical_Activity_Per_Week"] = 3
 
     # Esempio di partecipazione
-    if "partecipa sempre" in text or "molto attiva" in text:
+    if "participation_high" in found:
         features["Class_Participation_Level"] = "High"
-    elif "poco partecipe" in text:
+    elif "participation_low" in found:
         features["Class_Participation_Level"] = "Low"
     else:
         features["Class_Participation_Level"] = "Medium"
 
-    # Default numerici per campi non citati
-    defaults = {
-        "Strength_Score": 75,
-        "Endurance_Score": 70,
-        "Flexibility_Score": 60,
-        "Speed_Agility_Score": 65,
-        "BMI": 22.5,
-        "Health_Fitness_Knowledge_Score": 70,
-        "Skills_Score": 75,
-        "Attendance_Rate": 95,
-        "Overall_PE_Performance_Score": 80,
-        "Improvement_Rate": 10,
-        "Final_Grade": "B",
-        "Previous_Semester_PE_Grade": "B",
-        "Grade_Level": "11th",
-    }
-
-    for k, v in defaults.items():
-        if k not in features:
-            features[k] = v
-
-    return {"features": features, "message": "Features generate dal testo con successo!"}
+    # Default per i campi non citati (i valori estratti dal testo hanno la precedenza)
+    features = {**_PARSE_DEFAULTS, **features}
+
+    return ORJSONResponse({"features": features, "message": "Features generate dal testo con successo!"})
+
+
+app.add_route("/api/parse_text", parse_text, methods=["POST"])
 
 
 # ------------------- SERVE IL FRONTEND STATICO -------------------
@@ -180,6 +261,22 @@ BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 # Costruisce il percorso assoluto della cartella "frontend"
 FRONTEND_DIR = os.path.join(BASE_DIR, "frontend")
 
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles con header Cache-Control: CSS/JS restano in cache nel browser per un'ora,
+    mentre l'HTML viene sempre riconvalidato (tramite ETag/Last-Modified, risposta 304 se invariato).
+    """
+
+    def file_response(self, full_path, *args, **kwargs):
+        response = super().file_response(full_path, *args, **kwargs)
+        if str(full_path).endswith(".html"):
+            response.headers.setdefault("Cache-Control", "no-cache")
+        else:
+            response.headers.setdefault("Cache-Control", "public, max-age=3600")
+        return response
+
+
 # Monta la cartella frontend come root del sito web ("/")
 # In questo modo FastAPI servirà automaticamente index.html, script.js, styles.css, ecc.
-app.mount("/", StaticFiles(directory=FRONTEND_DIR, html=True), name="frontend")
\ No newline at end of file
+app.mount("/", CachedStaticFiles(directory=FRONTEND_DIR, html=True, check_dir=True), name="frontend")
\ No newline at end of file
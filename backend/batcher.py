@@ -0,0 +1,101 @@
+# Import base di Python per la gestione asincrona
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple  # Tipi per annotazioni chiare e strutturate
+import numpy as np                                     # Per impilare le righe in un'unica matrice
+# Esegue funzioni bloccanti (la predizione) nel threadpool senza bloccare l'event loop
+from starlette.concurrency import run_in_threadpool
+
+from .model_service import ModelService
+
+
+# -------------------- BATCHER DINAMICO --------------------
+class DynamicBatcher:
+    """
+    Raggruppa le richieste di predizione che arrivano quasi insieme:
+    - ogni richiesta prepara la sua riga e la mette in coda
+    - un task in background raccoglie fino a max_batch_size righe (aspettando al massimo max_delay secondi)
+    - il modello viene chiamato una sola volta per tutto il batch e i risultati tornano alle singole richieste
+    """
+
+    def __init__(self, service: ModelService, max_batch_size: int = 32, max_delay: float = 0.005) -> None:
+        self.service = service
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+    def start(self) -> None:
+        """Avvia il task che consuma la coda (va chiamato dentro l'event loop)."""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+
+    async def stop(self) -> None:
+        """Ferma il task in background (allo spegnimento dell'app)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+    async def predict(self, features: Dict[str, Any]) -> Tuple[Any, Optional[Dict[str, float]], Tuple[str, ...]]:
+        """Stessa interfaccia di ModelService.predict_one, ma passando dal batch."""
+        self.start()
+
+        # Gli errori di input vengono sollevati subito, senza coinvolgere le altre richieste del batch
+        row = self.service.prepare_row(features)
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((row, future))
+        return await future
+
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Attende la prima richiesta, poi raccoglie le altre fino a riempire il batch o scadere il tempo
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            X = np.stack([row for row, _ in batch])
+            try:
+                results = await run_in_threadpool(self.service.predict_rows, X)
+            except Exception:
+                # Il batch è fallito: si ripete riga per riga, così l'errore
+                # arriva solo alla richiesta che lo ha causato
+                results = await run_in_threadpool(self._predict_one_by_one, X)
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+    def _predict_one_by_one(self, X: np.ndarray) -> List[Any]:
+        """Predice ogni riga separatamente; per le righe che falliscono restituisce l'eccezione."""
+        results: List[Any] = []
+        for row in X:
+            try:
+                results.append(self.service.predict_rows(row.reshape(1, -1))[0])
+            except Exception as e:
+                results.append(e)
+        return results
@@ -2,10 +2,20 @@
 import json                              # (non usato direttamente ma utile per debug o serializzazione)
 from typing import Dict, Any, List, Tuple, Optional  # Tipi per annotazioni chiare e strutturate
 import numpy as np                       # Gestione array e numeri
-import pandas as pd                      # Gestione tabelle e DataFrame
 from joblib import load                  # Carica modelli o scaler salvati con joblib
 import pickle                            # Alternativa per caricare oggetti Python serializzati
 import os                                # Per lavorare con percorsi di file e directory
+from sklearn.ensemble._forest import ForestClassifier  # Classe base di RandomForest/ExtraTrees
+from sklearn.tree import DecisionTreeClassifier        # Classe base degli alberi di classificazione
+
+# Dipendenze opzionali: con PE_USE_ONNX=1 (e le librerie installate) il modello viene
+# compilato in ONNX ed eseguito con ONNX Runtime (codice C++ nativo) invece che con scikit-learn
+try:
+    import onnxruntime as ort
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+except ImportError:
+    ort = None
 
 
 # -------------------- PERCORSI FILE --------------------
@@ -17,6 +27,10 @@ MODEL_PATH = os.path.join(DATA_DIR, "random_forest_model.pkl")   # modello ML
 SCALER_PATH = os.path.join(DATA_DIR, "scaler.pkl")               # scaler dei dati
 ENCODERS_PATH = os.path.join(DATA_DIR, "label_encoders.pkl")     # encoders per le variabili categoriche
 
+# ONNX Runtime va attivato esplicitamente: calcola le probabilità in float32,
+# quindi i valori possono differire da scikit-learn all'ultima cifra
+USE_ONNX = os.environ.get("PE_USE_ONNX") == "1"
+
 
 # -------------------- CLASSE PRINCIPALE --------------------
 class ModelService:
@@ -36,6 +50,24 @@ class ModelService:
         self.scaler = self._safe_load(SCALER_PATH)
         self.encoders = self._safe_load(ENCODERS_PATH)
 
+        # Nome della classe del modello (es. "RandomForestClassifier"), mostrato dal frontend
+        self.model_name = type(self.model).__name__
+
+        # Chiavi (stringhe) del dizionario delle probabilità: le classi non cambiano dopo il caricamento
+        classes = getattr(self.model, "classes_", None)
+        if classes is None:
+            classes = getattr(self.model, "classes", None)
+        self._proba_keys = tuple(str(c) for c in classes) if classes is not None else None
+        # Classi usate per ricavare la predizione come argmax delle probabilità: vale solo per
+        # foreste e alberi di scikit-learn a singolo output, dove predict è esattamente
+        # classes_[argmax(predict_proba)] (non per es. per SVC(probability=True))
+        self._argmax_classes = (
+            classes
+            if isinstance(self.model, (ForestClassifier, DecisionTreeClassifier))
+            and isinstance(classes, np.ndarray) and classes.ndim == 1
+            else None
+        )
+
         # --- Recupero dei nomi delle feature ---
         # Alcuni modelli scikit-learn salvano 'feature_names_in_' come array numpy
         self.model_feature_names = getattr(self.model, "feature_names_in_", None)
@@ -57,23 +89,52 @@ class ModelService:
         # --- Opzioni categoriche per il frontend ---
         # Es. "Gender": ["Male", "Female", "Other"]
         self.categorical_options: Dict[str, List[str]] = {}
+        # Mappe precalcolate valore -> codice usate in predizione (al posto di enc.transform)
+        self._enc_maps: Dict[str, Dict[str, int]] = {}
+        # Colonne con LabelEncoder: i valori non visti vengono aggiunti in coda alle classi
+        self._enc_extendable = set()
         if isinstance(self.encoders, dict):
             for col, enc in self.encoders.items():
                 # Se è un LabelEncoder vero e proprio
                 if hasattr(enc, "classes_"):
                     self.categorical_options[col] = [str(x) for x in enc.classes_]
+                    self._enc_maps[col] = {str(c): i for i, c in enumerate(enc.classes_)}
+                    self._enc_extendable.add(col)
                 # Se è un dizionario (mapping esplicito)
                 elif isinstance(enc, dict):
                     self.categorical_options[col] = [str(x) for x in enc.keys()]
+                    self._enc_maps[col] = {str(k): int(v) for k, v in enc.items()}
                 # Se è una lista o array
                 elif isinstance(enc, (list, tuple, np.ndarray)):
                     self.categorical_options[col] = [str(x) for x in enc]
+                    self._enc_maps[col] = {str(c): i for i, c in enumerate(enc)}
                 else:
                     self.categorical_options[col] = []
 
         # Deduce la lista definitiva delle feature che il modello si aspetta
         self.expected_feature_names = self._infer_feature_names()
 
+        # Lo schema per il frontend non cambia dopo il caricamento: lo calcoliamo una volta sola
+        self._schema_cached = self._build_schema()
+
+        # --- Strutture precalcolate per la predizione ---
+        # Ordine definitivo delle colonne passate al modello (restituito anche come "used_features")
+        self._feat_order = tuple(self.model_feature_names or self.expected_feature_names)
+        # Per ogni colonna: True se è categorica (ha un encoder)
+        self._feat_encoded = tuple(
+            isinstance(self.encoders, dict) and name in self.encoders for name in self._feat_order
+        )
+        # Posizioni (nella riga del modello) delle colonne da scalare
+        self._scaler_idx, self._scaler_mask = self._infer_scaler_index()
+        # Parametri di uno StandardScaler (media e scala) per applicarlo senza sklearn.transform
+        self._scaler_mean, self._scaler_scale = self._infer_standard_scaling()
+
+        # Versione compilata del modello (ONNX Runtime), se disponibile
+        self._onnx = self._compile_onnx()
+
+        # Predizione "a vuoto" per non far pagare alla prima richiesta il costo di avvio del modello
+        self._warmup()
+
 
     # =========================================================
     # ---------------------- METODI UTILI ----------------------
@@ -88,6 +149,77 @@ class ModelService:
                 return pickle.load(f)
 
 
+    def _warmup(self) -> None:
+        """Esegue una predizione di prova su una riga di zeri (eventuali errori vengono ignorati)."""
+        X = np.zeros((1, len(self._feat_order)), dtype=np.float32)
+        try:
+            if self._onnx is not None:
+                self._onnx.run(None, {"input": X})
+            self.model.predict(X)
+            if hasattr(self.model, "predict_proba"):
+                self.model.predict_proba(X)
+        except Exception:
+            pass
+
+
+    def _compile_onnx(self):
+        """
+        Converte il classificatore in ONNX e crea una sessione ONNX Runtime.
+        Restituisce None (e si usa scikit-learn) se PE_USE_ONNX non è attivo, se le librerie
+        non sono installate, se il modello non è un classificatore o se la conversione fallisce.
+        """
+        if not USE_ONNX or ort is None or not hasattr(self.model, "predict_proba") or getattr(self.model, "classes_", None) is None:
+            return None
+        try:
+            onx = convert_sklearn(
+                self.model,
+                initial_types=[("input", FloatTensorType([None, len(self._feat_order)]))],
+                # Probabilità come matrice (n_righe x n_classi) invece che lista di dizionari
+                options={id(self.model): {"zipmap": False}},
+            )
+            return ort.InferenceSession(onx.SerializeToString(), providers=["CPUExecutionProvider"])
+        except Exception:
+            return None
+
+
+    def _infer_scaler_index(self) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """
+        Calcola, per ogni colonna attesa dallo scaler, la sua posizione nella riga del modello
+        (-1 se la colonna non è tra quelle del modello) e la maschera delle colonne presenti.
+        Senza nomi nello scaler, vengono scalate tutte le colonne.
+        """
+        if self.scaler is None or not hasattr(self.scaler, "transform"):
+            return None, None
+
+        if self.scaler_feature_names is not None and len(self.scaler_feature_names) > 0:
+            pos = {name: i for i, name in enumerate(self._feat_order)}
+            idx = np.array([pos.get(c, -1) for c in self.scaler_feature_names], dtype=np.intp)
+        else:
+            idx = np.arange(len(self._feat_order), dtype=np.intp)
+        return idx, idx >= 0
+
+
+    def _infer_standard_scaling(self) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """
+        Se lo scaler è uno StandardScaler (ha mean_ e scale_), restituisce media e scala
+        delle sole colonne presenti nel modello, così da applicare (x - media) / scala
+        direttamente con NumPy. Per altri scaler restituisce (None, None).
+        """
+        if self._scaler_idx is None or not (hasattr(self.scaler, "mean_") and hasattr(self.scaler, "scale_")):
+            return None, None
+
+        n = self._scaler_idx.size
+        mean = self.scaler.mean_ if getattr(self.scaler, "with_mean", True) else None
+        scale = self.scaler.scale_ if getattr(self.scaler, "with_std", True) else None
+        mean = np.zeros(n) if mean is None else np.asarray(mean, dtype=np.float64)
+        scale = np.ones(n) if scale is None else np.asarray(scale, dtype=np.float64)
+        if mean.shape != (n,) or scale.shape != (n,):
+            return None, None
+
+        mask = self._scaler_mask
+        return mean[mask], scale[mask]
+
+
     def _infer_feature_names(self) -> List[str]:
         """
         Tenta di determinare quali colonne (feature) il modello si aspetta in input.
@@ -141,6 +273,11 @@ class ModelService:
     # =========================================================
 
     def schema_for_frontend(self) -> Dict[str, Any]:
+        """Restituisce lo schema per il frontend, calcolato una volta sola nel costruttore."""
+        return self._schema_cached
+
+
+    def _build_schema(self) -> Dict[str, Any]:
         """
         Costruisce la "scheda" (schema) che descrive al frontend quali campi mostrare nel form.
         Ogni campo contiene nome, tipo (numero o select), e eventuali opzioni.
@@ -170,144 +307,156 @@ class ModelService:
     def _safe_label_transform(self, col: str, value: Any) -> Any:
         """
         Converte un valore categorico nel corrispondente valore numerico,
-        usando l'encoder salvato. Gestisce vari casi (LabelEncoder, dict, lista).
+        usando la mappa precalcolata dall'encoder salvato (LabelEncoder, dict, lista).
         """
-        enc = self.encoders.get(col) if isinstance(self.encoders, dict) else None
-        if enc is None:
+        m = self._enc_maps.get(col)
+        if m is None:
             return value
 
         val = str(value)
+        code = m.get(val)
+        if code is None:
+            # Valore non visto: con un LabelEncoder lo aggiunge in coda alle classi conosciute,
+            # negli altri casi lo codifica come -1
+            code = m.setdefault(val, len(m)) if col in self._enc_extendable else -1
+        return code
 
-        if hasattr(enc, "transform"):
-            # Caso LabelEncoder
-            try:
-                return int(enc.transform([val])[0])
-            except Exception:
-                # Se valore non visto, prova ad aggiungerlo alle classi conosciute
-                if hasattr(enc, "classes_"):
-                    classes = list(enc.classes_)
-                    if val not in classes:
-                        classes.append(val)
-                        enc.classes_ = np.array(classes, dtype=object)
-                    return int(enc.transform([val])[0])
-                return -1
-
-        # Caso dizionario semplice
-        if isinstance(enc, dict):
-            return int(enc.get(val, -1))
-
-        # Caso lista o array
-        if isinstance(enc, (list, tuple, np.ndarray)):
+
+    def _build_row(self, features: Dict[str, Any]) -> np.ndarray:
+        """
+        Costruisce la riga numerica (già nell'ordine atteso dal modello) a partire dal dizionario
+        di input. I valori non validi (None, categorici non numerici) diventano NaN.
+        """
+        row = np.zeros(len(self._feat_order), dtype=np.float64)
+
+        for i, (name, encoded) in enumerate(zip(self._feat_order, self._feat_encoded)):
+            # Colonne mancanti restano a 0
+            if name not in features:
+                continue
+            value = features[name]
+
+            # Encoding delle colonne categoriche conosciute
+            if encoded:
+                value = self._safe_label_transform(name, str(value))
+            elif value is None:
+                row[i] = np.nan
+                continue
+
+            # Conversione in numero: i valori non convertibili valgono 0 (se non categorici)
             try:
-                return int(list(enc).index(val))
-            except ValueError:
-                return -1
+                row[i] = float(value)
+            except (TypeError, ValueError):
+                if encoded:
+                    row[i] = np.nan
 
-        return value
+        return row
 
 
-    def _align_and_scale(self, X: pd.DataFrame) -> np.ndarray:
+    def _align_and_scale(self, X: np.ndarray) -> np.ndarray:
         """
-        Allinea le colonne dell'input con l'ordine atteso dal modello
-        e applica lo scaler solo dove serve.
+        Applica lo scaler solo alle colonne che lo richiedono, su tutte le righe
+        della matrice (n_righe x n_feature) già ordinata come atteso dal modello.
         """
-        # Allineamento colonne all’ordine del modello
-        if self.model_feature_names is not None:
-            for col in self.model_feature_names:
-                if col not in X.columns:
-                    X[col] = 0
-            X = X.loc[:, self.model_feature_names]
-        else:
-            exp = list(self.expected_feature_names)
-            for col in exp:
-                if col not in X.columns:
-                    X[col] = 0
-            X = X.loc[:, exp]
-
-        # Scaling dei valori numerici
-        if self.scaler is not None and hasattr(self.scaler, "transform"):
-            if self.scaler_feature_names is not None and len(self.scaler_feature_names) > 0:
-                cols = list(self.scaler_feature_names)
-                for c in cols:
-                    if c not in X.columns:
-                        X[c] = 0.0
-                X[cols] = self.scaler.transform(X[cols])
-            else:
-                num_cols = X.select_dtypes(include=[np.number]).columns
-                if len(num_cols) > 0:
-                    X[num_cols] = self.scaler.transform(X[num_cols])
-
-        # Ritorna i valori come array numpy pronto per il modello
-        return X.values
+        if self._scaler_mean is not None:
+            # StandardScaler: stessa formula di scaler.transform, ma senza la validazione di sklearn
+            cols = self._scaler_idx[self._scaler_mask]
+            X[:, cols] = (X[:, cols] - self._scaler_mean) / self._scaler_scale
+        elif self._scaler_idx is not None:
+            idx, mask = self._scaler_idx, self._scaler_mask
+            # Le colonne dello scaler assenti nel modello vengono passate a 0
+            scaler_in = np.zeros((X.shape[0], idx.size), dtype=np.float64)
+            scaler_in[:, mask] = X[:, idx[mask]]
+            X[:, idx[mask]] = self.scaler.transform(scaler_in)[:, mask]
+
+        # Ritorna la matrice pronta per il modello, in float32: gli alberi di scikit-learn
+        # lavorano in float32, così si evita la copia di conversione dentro predict/predict_proba
+        return X.astype(np.float32, copy=False)
 
 
     # =========================================================
     # ---------------------- PREDICT ----------------------
     # =========================================================
 
-    def predict_one(self, features: Dict[str, Any]) -> Tuple[Any, Optional[Dict[str, float]], List[str]]:
+    def prepare_row(self, features: Dict[str, Any]) -> np.ndarray:
         """
-        Esegue una singola predizione a partire da un dizionario di feature.
-        Restituisce: (predizione, probabilità, feature usate)
+        Converte un dizionario di feature nella riga già scalata (float32)
+        da passare a predict_rows. Solleva ValueError se l'input non è valido.
         """
-        # 1️⃣ Crea un DataFrame con una sola riga
-        df = pd.DataFrame([features])
-
-        # 2️⃣ Applica encoding alle colonne categoriche conosciute
-        if isinstance(self.encoders, dict):
-            for col in self.encoders.keys():
-                if col in df.columns:
-                    df[col] = df[col].astype(str).map(lambda v: self._safe_label_transform(col, v))
-
-        # 3️⃣ Aggiunge eventuali colonne mancanti
-        exp = list(self.model_feature_names) if self.model_feature_names is not None else list(self.expected_feature_names)
-        for col in exp:
-            if col not in df.columns:
-                df[col] = 0
-
-        # 4️⃣ Converte in numerico dove possibile
-        for c in df.columns:
-            if df[c].dtype == object:
-                try:
-                    df[c] = pd.to_numeric(df[c])
-                except Exception:
-                    if not (isinstance(self.encoders, dict) and c in self.encoders):
-                        df[c] = 0
-
-        # 5️⃣ Controlla che non restino colonne non numeriche prima dello scaling
-        non_numeric_before_scale = df.select_dtypes(exclude=[np.number]).columns.tolist()
-        if len(non_numeric_before_scale) > 0:
+        # 1️⃣-4️⃣ Costruisce direttamente la riga numerica nell'ordine del modello
+        # (encoding categorico, colonne mancanti a 0, conversione in numero)
+        row = self._build_row(features)
+
+        # 5️⃣ Scala e converte in float32: il controllo va fatto sul valore finale, perché
+        # un numero enorme ma finito può diventare infinito dopo lo scaling o il cast a float32
+        # (l'overflow viene segnalato dal controllo sotto, non serve il warning di NumPy)
+        with np.errstate(over="ignore", invalid="ignore"):
+            row = self._align_and_scale(row.reshape(1, -1))[0]
+
+        # 6️⃣ Un solo controllo vettoriale: nessun NaN/infinito nella riga che arriverà al modello
+        if not np.isfinite(row).all():
+            bad = [self._feat_order[i] for i in np.flatnonzero(~np.isfinite(row))]
             raise ValueError(
-                f"Colonne non numeriche prima dello scaling: {non_numeric_before_scale}. "
-                f"Valori: {df[non_numeric_before_scale].to_dict(orient='records')[0]}"
+                f"Valori mancanti, non numerici o fuori scala nelle colonne: {bad}. Controlla i valori inseriti."
             )
 
-        # 6️⃣ Allinea, scala e ottieni la predizione
-        X = self._align_and_scale(df)
-
-        if np.isnan(X).any():
-            raise ValueError("Sono presenti NaN nell'input dopo l'allineamento/scaling. Controlla i valori inseriti.")
-
-        y_pred = self.model.predict(X)
-
-        # 7️⃣ Converti la predizione in tipo Python puro
-        pred_value = y_pred[0]
-        if isinstance(pred_value, np.generic):
-            pred_value = pred_value.item()
-
-        # 8️⃣ Calcola probabilità per ogni classe (se disponibile)
-        proba_dict: Optional[Dict[str, float]] = None
-        if hasattr(self.model, "predict_proba"):
-            probs = self.model.predict_proba(X)[0]
-            classes = getattr(self.model, "classes_", None)
-            if classes is None:
-                classes = getattr(self.model, "classes", None)
-            if isinstance(classes, np.ndarray):
-                classes = classes.tolist()
-            if classes is None:
-                classes = list(range(len(probs)))
-            proba_dict = {str(cls): float(p) for cls, p in zip(classes, probs)}
-
-        # 9️⃣ Restituisce tutto
-        used_features = list(exp)
-        return pred_value, proba_dict, used_features
\ No newline at end of file
+        return row
+
+
+    def predict_rows(self, X: np.ndarray) -> List[Tuple[Any, Optional[Dict[str, float]], Tuple[str, ...]]]:
+        """
+        Esegue la predizione su più righe preparate (e già scalate) con prepare_row,
+        impilate in una matrice, con una sola chiamata a predict/predict_proba per tutto il batch.
+        Restituisce, per ogni riga: (predizione, probabilità, feature usate)
+        """
+        # 7️⃣ Ottieni le predizioni (con le probabilità, se disponibili)
+        all_probs = None
+        if self._onnx is not None:
+            # Modello compilato: etichette e probabilità in un'unica chiamata nativa.
+            # Le probabilità sono accumulate in float32: l'arrotondamento a 7 decimali accorcia
+            # solo la conversione in float Python (0.30000001192092896 -> 0.3), ma non elimina
+            # l'errore di accumulo (es. 0.6999999 dove scikit-learn restituisce 0.7)
+            y_pred, all_probs = self._onnx.run(None, {"input": X})
+            all_probs = all_probs.astype(np.float64).round(7)
+        elif self._argmax_classes is not None:
+            # Classificatore: predict farebbe di nuovo predict_proba + argmax, quindi
+            # si attraversano gli alberi una volta sola e si ricava l'etichetta dalle probabilità
+            all_probs = self.model.predict_proba(X)
+            y_pred = self._argmax_classes.take(np.argmax(all_probs, axis=1))
+        else:
+            y_pred = self.model.predict(X)
+            if hasattr(self.model, "predict_proba"):
+                all_probs = self.model.predict_proba(X)
+
+        # 8️⃣ Associa le probabilità alle classi (chiavi precalcolate nel costruttore)
+        keys = self._proba_keys
+        probs_rows = None
+        if all_probs is not None:
+            if keys is None:
+                keys = tuple(str(i) for i in range(all_probs.shape[1]))
+            # tolist() converte tutta la matrice in float Python con un solo ciclo in C
+            probs_rows = all_probs.tolist()
+
+        results = []
+        for i in range(X.shape[0]):
+            # Converti la predizione in tipo Python puro
+            pred_value = y_pred[i]
+            if isinstance(pred_value, np.generic):
+                pred_value = pred_value.item()
+
+            proba_dict: Optional[Dict[str, float]] = None
+            if probs_rows is not None:
+                proba_dict = dict(zip(keys, probs_rows[i]))
+
+            # 9️⃣ Restituisce tutto (l'ordine delle feature è una tupla immutabile: nessuna copia)
+            results.append((pred_value, proba_dict, self._feat_order))
+
+        return results
+
+
+    def predict_one(self, features: Dict[str, Any]) -> Tuple[Any, Optional[Dict[str, float]], Tuple[str, ...]]:
+        """
+        Esegue una singola predizione a partire da un dizionario di feature.
+        Restituisce: (predizione, probabilità, feature usate)
+        """
+        row = self.prepare_row(features)
+        return self.predict_rows(row.reshape(1, -1))[0]
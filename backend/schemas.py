@@ -1,15 +1,15 @@
-# Importiamo BaseModel e Field da Pydantic
-# Pydantic serve per la validazione automatica dei dati in FastAPI
-from pydantic import BaseModel, Field
+# Importiamo msgspec: le Struct vengono decodificate/serializzate in JSON direttamente in C,
+# con campi a slot fissi (niente __dict__ e niente validatori per campo come in Pydantic)
+import msgspec
 
 # Importiamo alcuni tipi standard di Python per maggiore chiarezza
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Optional, Tuple
 
 
 # ================================
 # 🔹 MODELLO DI RICHIESTA (INPUT)
 # ================================
-class PredictRequest(BaseModel):
+class PredictRequest(msgspec.Struct):
     """
     Rappresenta la struttura del corpo della richiesta (JSON)
     che il frontend invia all'endpoint /api/predict.
@@ -25,19 +25,16 @@ class PredictRequest(BaseModel):
     }
     """
 
-    # 'features' è un dizionario flessibile:
+    # 'features' è un dizionario flessibile (campo obbligatorio):
     # chiave = nome della colonna (es. "Age")
     # valore = input inserito dall'utente
-    features: Dict[str, Any] = Field(
-        ...,  # il campo è obbligatorio
-        description="Coppie colonna->valore per una singola riga di input"
-    )
+    features: Dict[str, Any]
 
 
 # ================================
 # 🔹 MODELLO DI RISPOSTA (OUTPUT)
 # ================================
-class PredictResponse(BaseModel):
+class PredictResponse(msgspec.Struct, kw_only=True):
     """
     Descrive il formato della risposta JSON
     che il backend restituisce dopo la predizione.
@@ -47,6 +44,7 @@ class PredictResponse(BaseModel):
         "prediction": "High",
         "proba": {"Low": 0.05, "Medium": 0.10, "High": 0.85},
         "used_features": ["Age", "Gender", "BMI", ...],
+        "model_name": "RandomForestClassifier",
         "message": "OK"
     }
     """
@@ -57,8 +55,11 @@ class PredictResponse(BaseModel):
     # Probabilità per ciascuna classe (se il modello supporta predict_proba)
     proba: Optional[Dict[str, float]] = None
 
-    # Lista dei nomi di feature effettivamente usate dal modello
-    used_features: List[str]
+    # Nomi delle feature effettivamente usate dal modello (serializzati come lista JSON)
+    used_features: Tuple[str, ...]
+
+    # Nome della classe del modello usato per la predizione
+    model_name: str
 
     # Messaggio di stato (es. "OK" o descrizione errore)
-    message: str
\ No newline at end of file
+    message: str
@@ -0,0 +1,52 @@
+# Fixture comuni ai test: crea modello, scaler e label encoders sintetici
+# in una cartella temporanea, così i test non dipendono dai file .pkl reali
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+from backend import model_service as model_service_module
+
+
+@pytest.fixture
+def model_service(tmp_path, monkeypatch):
+    """ModelService caricato da artefatti sintetici (stessa struttura di quelli reali)."""
+    rng = np.random.default_rng(0)
+    n = 200
+    df = pd.DataFrame({
+        "Age": rng.integers(14, 19, n),
+        "Gender": rng.choice(["Male", "Female", "Other"], n),
+        "BMI": rng.normal(22, 3, n),
+        "Motivation_Level": rng.choice(["Low", "Medium", "High"], n),
+        "Strength_Score": rng.normal(70, 10, n),
+    })
+    y = rng.choice(["Low", "Medium", "High"], n)
+
+    encoders = {}
+    for col in ["Gender", "Motivation_Level"]:
+        encoders[col] = LabelEncoder().fit(df[col])
+        df[col] = encoders[col].transform(df[col])
+    numeric = ["Age", "BMI", "Strength_Score"]
+    scaler = StandardScaler().fit(df[numeric])
+    df[numeric] = scaler.transform(df[numeric])
+    model = RandomForestClassifier(n_estimators=10, random_state=0).fit(df, y)
+
+    paths = {
+        "MODEL_PATH": tmp_path / "random_forest_model.pkl",
+        "SCALER_PATH": tmp_path / "scaler.pkl",
+        "ENCODERS_PATH": tmp_path / "label_encoders.pkl",
+    }
+    joblib.dump(model, paths["MODEL_PATH"])
+    joblib.dump(scaler, paths["SCALER_PATH"])
+    joblib.dump(encoders, paths["ENCODERS_PATH"])
+    for name, path in paths.items():
+        monkeypatch.setattr(model_service_module, name, str(path))
+
+    return model_service_module.ModelService()
+
+
+@pytest.fixture
+def valid_features():
+    return {"Age": 16, "Gender": "Male", "BMI": 21.5, "Motivation_Level": "High", "Strength_Score": 80}
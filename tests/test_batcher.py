@@ -0,0 +1,60 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from backend.batcher import DynamicBatcher
+
+
+async def _predict_all(batcher, payloads):
+    try:
+        return await asyncio.gather(*[batcher.predict(p) for p in payloads], return_exceptions=True)
+    finally:
+        await batcher.stop()
+
+
+def test_bad_row_fails_only_its_own_request(model_service, valid_features):
+    # BMI enorme ma finito: diventa infinito solo dopo scaling + cast a float32
+    payloads = [valid_features] * 10 + [{"BMI": 1e300}]
+    batcher = DynamicBatcher(model_service, max_batch_size=32, max_delay=0.05)
+
+    results = asyncio.run(_predict_all(batcher, payloads))
+
+    expected = model_service.predict_one(valid_features)
+    assert results[:10] == [expected] * 10
+    assert isinstance(results[10], ValueError)
+    assert "BMI" in str(results[10])
+
+
+class _FailingRowService:
+    """Servizio finto: predict_rows fallisce se nel batch c'è una riga negativa."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def prepare_row(self, features):
+        return np.array([features["x"]], dtype=np.float32)
+
+    def predict_rows(self, X):
+        self.batch_sizes.append(X.shape[0])
+        if (X < 0).any():
+            raise ValueError("riga non valida")
+        return [(float(x[0]), None, ("x",)) for x in X]
+
+
+def test_failed_batch_is_retried_row_by_row():
+    service = _FailingRowService()
+    batcher = DynamicBatcher(service, max_batch_size=32, max_delay=0.05)
+    payloads = [{"x": i} for i in range(5)] + [{"x": -1}]
+
+    results = asyncio.run(_predict_all(batcher, payloads))
+
+    assert results[:5] == [(float(i), None, ("x",)) for i in range(5)]
+    assert isinstance(results[5], ValueError)
+    # Un solo batch fallito, poi una chiamata per riga
+    assert service.batch_sizes == [6, 1, 1, 1, 1, 1, 1]
+
+
+def test_predict_one_rejects_overflow_after_scaling(model_service):
+    with pytest.raises(ValueError, match="BMI"):
+        model_service.predict_one({"BMI": 1e300})
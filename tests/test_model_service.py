@@ -0,0 +1,25 @@
+import joblib
+import numpy as np
+from sklearn.svm import SVC
+
+from backend import model_service as model_service_module
+
+
+def test_forest_labels_match_model_predict(model_service):
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(200, len(model_service._feat_order))).astype(np.float32)
+
+    labels = [pred for pred, _, _ in model_service.predict_rows(X)]
+
+    assert model_service._argmax_classes is not None
+    assert labels == model_service.model.predict(X).tolist()
+
+
+def test_argmax_shortcut_only_for_forests_and_trees(tmp_path, monkeypatch, model_service):
+    X = np.random.default_rng(2).normal(size=(60, len(model_service._feat_order)))
+    y = np.array(["Low", "Medium", "High"] * 20)
+    path = tmp_path / "svc.pkl"
+    joblib.dump(SVC(probability=True, random_state=0).fit(X, y), path)
+    monkeypatch.setattr(model_service_module, "MODEL_PATH", str(path))
+
+    assert model_service_module.ModelService()._argmax_classes is None